@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+import numpy as np
+import pymupdf, re
+
+# ---------- parsing ----------
+# un solo pattern per durate ("d") e percentuali ("p"): il gruppo che matcha dà il tipo
+TOKEN_RE = re.compile(r"(?P<d>\d{1,2}:\d{2}:\d{2})|(?P<p>\d{1,3}(?:[.,]\d+)?%)")
+PAREN_COUNT_RE = re.compile(r"\s*\(\d+\)\s*$")  # suffisso "(N)" delle righe di progetto
+
+# colonne restituite da parse_page: un dict di liste parallele (struct-of-arrays)
+COLUMNS = ["PROJECT", "DURATION", "DURATION_%", "AMOUNT", "CLIENT"]
+
+def empty_columns():
+    return {c: [] for c in COLUMNS}
+
+def extend_columns(dst, src):
+    for c in COLUMNS:
+        dst[c].extend(src[c])
+    return dst
+
+DUR_ANY_RE = re.compile(r"\d{1,2}:\d{2}:\d{2}")
+
+def body_textpage(page):
+    """TextPage del corpo pagina (margini esclusi): si estrae una volta e si riusa."""
+    w, h = page.rect.width, page.rect.height
+    clip = pymupdf.Rect(w * 0.04, h * 0.06, w * 0.96, h * 0.95)
+    return page.get_textpage(clip=clip, flags=pymupdf.TEXTFLAGS_WORDS)
+
+@dataclass
+class Words:
+    """Parole di una pagina come array paralleli (struct-of-arrays), senza overhead pandas."""
+    x0: np.ndarray
+    top: np.ndarray
+    text: np.ndarray
+
+    def __len__(self):
+        return len(self.text)
+
+def extract_words_page(textpage):
+    # PyMuPDF restituisce già tuple (x0, y0, x1, y1, text, block, line, word)
+    words = textpage.extractWORDS()
+    if not words:
+        return Words(np.empty(0), np.empty(0), np.empty(0, dtype=object))
+    x0, top, _, _, text, *_ = zip(*words)
+    return Words(np.array(x0), np.array(top), np.array(text, dtype=object))
+
+# === NOVITÀ: calcolo dinamico dei bordi colonne ===
+HEADER_KEYS = frozenset(("duration", "client"))
+
+def find_headers(x0, text):
+    """x0 minimo di ogni intestazione in HEADER_KEYS, cercate tutte in un solo passaggio sulle parole."""
+    found = {}
+    for x, t in zip(x0, text):
+        key = t.strip().lower()
+        if key in HEADER_KEYS and x < found.get(key, np.inf):
+            found[key] = x
+    return found
+
+def guess_left_xlimit(headers, default=260.0):
+    """Usa la posizione dell'header 'DURATION' come bordo destro della colonna sinistra."""
+    if "duration" in headers:
+        return float(headers["duration"]) - 5.0
+    return default
+
+def guess_client_xmin(headers, x0, default_quantile=0.85):
+    """Usa la posizione dell'header 'CLIENT' come bordo sinistro della colonna client, altrimenti quantile destro."""
+    if "client" in headers:
+        return float(headers["client"]) - 5.0
+    return float(np.quantile(x0, default_quantile))
+
+# === funzioni di lettura riga ===
+def _join_by_row(row_id, x0, text, n_rows):
+    """Unisce il testo di ogni riga in ordine di x0, con un solo ordinamento per tutte le righe."""
+    # le parole arrivano ordinate per (top, x0): se ogni riga ha una sola top sono già in
+    # ordine (riga, x0) e il controllo O(n) evita l'ordinamento
+    if np.all((np.diff(row_id) > 0) | (np.diff(x0) >= 0)):
+        words = text.tolist()
+    else:
+        order = np.lexsort((x0, row_id))
+        row_id, words = row_id[order], text[order].tolist()
+    bounds = np.searchsorted(row_id, np.arange(n_rows + 1))
+    return [" ".join(words[s:e]).strip() for s, e in zip(bounds[:-1], bounds[1:])]
+
+def row_texts(top_s, x0_s, text_s, tops, x_limit, x_min, y_tol=5.0):
+    """Per ogni riga (top della durata) restituisce (testo sinistro, CLIENT); le parole arrivano già ordinate per (top, x0)."""
+    # banda [top - y_tol, top + y_tol] di ogni riga come intervallo contiguo
+    lo = np.searchsorted(top_s, tops - y_tol, side="left")
+    hi = np.searchsorted(top_s, tops + y_tol, side="right")
+    # espande le bande in coppie (riga, parola) senza cicli Python
+    counts = hi - lo
+    row_id = np.repeat(np.arange(len(tops)), counts)
+    idx = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+    x0, text = x0_s[idx], text_s[idx]
+    is_left = x0 < x_limit
+    is_client = (x0 >= x_min) & (text != "-")  # escludi l'eventuale "-" dell'AMOUNT
+    left = _join_by_row(row_id[is_left], x0[is_left], text[is_left], len(tops))
+    client = _join_by_row(row_id[is_client], x0[is_client], text[is_client], len(tops))
+    return list(zip(left, client))
+
+def classify_left(left: str):
+    if not left: return None, None
+    head = left[:7].lower()  # basta il prefisso per "total"/"without"
+    if head.startswith("total"): return "TOTAL", None
+    if head == "without": return "Without project", None
+    # left arriva già strip-pato: senza ")" finale la regex non può matchare (membri)
+    m = PAREN_COUNT_RE.search(left) if left[-1] == ")" else None
+    if m:
+        return left[:m.start()].strip(), None
+    return None, left  # membro
+
+def document_headers(pdf, start=0):
+    """Header DURATION/CLIENT della prima pagina con durate da `start` in poi.
+
+    Le colonne hanno la stessa posizione su tutte le pagine del report: il risultato si
+    calcola una volta e si passa a parse_page. None se quella pagina non li ha entrambi.
+    """
+    for i in range(start, pdf.page_count):
+        textpage = body_textpage(pdf[i])
+        if DUR_ANY_RE.search(textpage.extractText()):
+            words = extract_words_page(textpage)
+            headers = find_headers(words.x0, words.text)
+            return headers if HEADER_KEYS <= headers.keys() else None
+    return None
+
+def parse_page(page, headers=None):
+    """Colonne della pagina; `headers` (da document_headers) evita di ricercare gli header pagina per pagina."""
+    textpage = body_textpage(page)
+    # scarto rapido: senza durate nel testo la pagina non ha righe da estrarre
+    if not DUR_ANY_RE.search(textpage.extractText()):
+        return empty_columns()
+    words = extract_words_page(textpage)
+    if not len(words): return empty_columns()
+    # parole ordinate per (top, x0) una volta sola: maschere, bordi e bande lavorano su questi buffer
+    order = np.lexsort((words.x0, words.top))
+    top, x0, text = words.top[order], words.x0[order], words.text[order]
+    # prefiltro economico: solo le parole con ":" o "%" finale arrivano alla regex
+    kinds = np.array([
+        m.lastgroup if (":" in t or t[-1:] == "%") and (m := TOKEN_RE.fullmatch(t)) else ""
+        for t in text
+    ], dtype="U1")
+    dur_mask = kinds == "d"
+    pct_mask = kinds == "p"
+
+    # nuovi limiti dinamici
+    if headers is None:
+        headers = find_headers(x0, text)
+    x_left_limit = guess_left_xlimit(headers)
+    x_client_min = guess_client_xmin(headers, x0)
+
+    dur_top = top[dur_mask]
+    dur_text = text[dur_mask]
+    pct_text = text[pct_mask]
+    # testo sinistro e CLIENT di tutte le righe in un solo passaggio
+    texts = row_texts(top, x0, text, dur_top, x_left_limit, x_client_min)
+
+    cols = empty_columns()
+    for d_txt, p_txt, (left, client) in zip(dur_text, pct_text, texts):
+        proj, _ = classify_left(left)
+        if proj is None:  # riga vuota o membro: si estraggono solo progetti e totali
+            continue
+        cols["PROJECT"].append(proj)
+        cols["DURATION"].append(d_txt)
+        cols["DURATION_%"].append(p_txt)
+        cols["AMOUNT"].append("-")
+        cols["CLIENT"].append(client)
+    return cols
+
+def parse_pages(file_bytes: bytes, start: int, stop: int, headers=None):
+    """Colonne delle pagine [start, stop); apre il PDF per conto proprio, così può girare in un processo separato."""
+    cols = empty_columns()
+    with pymupdf.open(stream=file_bytes, filetype="pdf") as pdf:
+        for i in range(start, stop):
+            extend_columns(cols, parse_page(pdf[i], headers))
+    return cols
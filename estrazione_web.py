@@ -1,149 +1,118 @@
 import streamlit as st
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import hashlib, os
+import numpy as np
 import pandas as pd
-import pdfplumber, re, tempfile
-
-st.set_page_config(
-    page_title="Toggl → Excel",
-    page_icon="📊",
-    layout="centered"
-)
-# ---------- parsing ----------
-DUR_RE = re.compile(r"^\d{1,2}:\d{2}:\d{2}$")
-PCT_RE = re.compile(r"^\d{1,3}(?:\.\d+)?%$")
-
-def extract_words_page(page):
-    w, h = page.width, page.height
-    bbox = (w * 0.04, h * 0.06, w * 0.96, h * 0.95)
-    body = page.crop(bbox)
-    words = body.extract_words(
-        x_tolerance=2.0, y_tolerance=2.5,
-        keep_blank_chars=False, use_text_flow=True
-    )
-    return pd.DataFrame(words) if words else pd.DataFrame()
-
-# === NOVITÀ: calcolo dinamico dei bordi colonne ===
-def guess_left_xlimit(words_df, default=260.0):
-    """Usa la posizione dell'header 'DURATION' come bordo destro della colonna sinistra."""
-    mask = words_df["text"].astype(str).str.strip().str.lower().eq("duration")
-    if mask.any():
-        return float(words_df.loc[mask, "x0"].min()) - 5.0
-    return default
-
-def guess_client_xmin(words_df, default_quantile=0.85):
-    """Usa la posizione dell'header 'CLIENT' come bordo sinistro della colonna client, altrimenti quantile destro."""
-    mask = words_df["text"].astype(str).str.strip().str.lower().eq("client")
-    if mask.any():
-        return float(words_df.loc[mask, "x0"].min()) - 5.0
-    return float(words_df["x0"].quantile(default_quantile))
-
-# === funzioni di lettura riga ===
-def left_text_near(words_df, top, x_limit, y_tol=5.0):
-    local = words_df[
-        (words_df["top"] >= top - y_tol) &
-        (words_df["top"] <= top + y_tol) &
-        (words_df["x0"] < x_limit)
-    ].sort_values("x0")
-    return " ".join(local["text"].astype(str).tolist()).strip()
-
-def client_text_near(words_df, top, x_min, y_tol=5.0):
-    local = words_df[
-        (words_df["top"] >= top - y_tol) &
-        (words_df["top"] <= top + y_tol) &
-        (words_df["x0"] >= x_min)
-    ].sort_values("x0")
-    if local.empty:
-        return ""
-    texts = local["text"].astype(str)
-    # escludi l'eventuale "-" dell'AMOUNT
-    texts = texts[~texts.eq("-")]
-    return " ".join(texts.tolist()).strip()
-
-def classify_left(left: str):
-    if not left: return None, None
-    lo = left.lower()
-    if lo.startswith("total"): return "TOTAL", None
-    if lo.startswith("without"): return "Without project", None
-    if re.search(r"\(\d+\)\s*$", left):
-        return re.sub(r"\s*\(\d+\)$", "", left).strip(), None
-    return None, left  # membro
-
-def parse_page(page):
-    words = extract_words_page(page)
-    if words.empty: return []
-    dur = words[words["text"].astype(str).str.match(DUR_RE)].sort_values("top")
-    pct = words[words["text"].astype(str).str.match(PCT_RE)].sort_values("top")
-
-    # nuovi limiti dinamici
-    x_left_limit = guess_left_xlimit(words)
-    x_client_min = guess_client_xmin(words)
-
-    rows = []
-    for (_, d), (_, p) in zip(dur.iterrows(), pct.iterrows()):
-        top_val = float(d["top"])
-        left = left_text_near(words, top_val, x_left_limit)  # usa limite dinamico
-        proj, mem = classify_left(left)
-        if proj is None and mem is None:
-            continue
-        client = client_text_near(words, top_val, x_client_min)  # estrai CLIENT sulla destra
-        rows.append({
-            "PROJECT": proj,
-            "MEMBER": mem,
-            "DURATION": d["text"],
-            "DURATION_%": p["text"],
-            "AMOUNT": "-",
-            "CLIENT": client
-        })
-    return rows
-
-@st.cache_data(show_spinner=False)
-def process_pdf(file_bytes: bytes) -> pd.DataFrame:
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=True) as tmp:
-        tmp.write(file_bytes)
-        tmp.flush()
-        all_rows = []
-        with pdfplumber.open(tmp.name) as pdf:
-            for i in range(1, len(pdf.pages)):  # salta sempre pagina 1
-                all_rows.extend(parse_page(pdf.pages[i]))
-    df = pd.DataFrame(all_rows)
-    if not df.empty:
-        # tieni solo progetti (no membri)
-        df = df[df["MEMBER"].isna() | (df["MEMBER"].astype(str).str.strip() == "")]
-        df["DURATION_%"] = df["DURATION_%"].astype(str).str.replace(",", ".", regex=False)
-        df["CLIENT"] = df["CLIENT"].astype(str).str.strip()
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pymupdf
+import xlsxwriter
+
+from estrazione import COLUMNS, document_headers, empty_columns, extend_columns, parse_page, parse_pages
+
+# ---------- elaborazione ----------
+# sotto questa soglia l'avvio dei processi costa più del parsing stesso
+PARALLEL_MIN_PAGES = 32
+# ogni processo riceve una copia del PDF: oltre questo numero la memoria cresce più del guadagno
+MAX_WORKERS = 8
+
+# chiave di cache = solo content_hash: il "_" iniziale esclude i byte del PDF dall'hashing di Streamlit;
+# poche voci per non trattenere report vecchi in RAM
+@st.cache_data(show_spinner=False, max_entries=16)
+def process_pdf(content_hash: str, _file_bytes: bytes) -> pd.DataFrame:
+    with pymupdf.open(stream=_file_bytes, filetype="pdf") as pdf:
+        n_pages = pdf.page_count
+        workers = min(MAX_WORKERS, os.cpu_count() or 1, n_pages - 1)
+        # posizione delle colonne letta una volta per documento (salta pagina 1) e passata a ogni pagina
+        headers = document_headers(pdf, start=1)
+        if n_pages - 1 >= PARALLEL_MIN_PAGES and workers > 1:
+            # pagine indipendenti: un blocco contiguo per processo, ognuno apre il PDF una volta
+            bounds = np.linspace(1, n_pages, workers + 1).astype(int)
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                parts = ex.map(parse_pages, [_file_bytes] * workers, bounds[:-1], bounds[1:], [headers] * workers)
+                cols = reduce(extend_columns, parts, empty_columns())
+        else:
+            cols = empty_columns()
+            for i in range(1, n_pages):  # salta pagina 1 (riepilogo)
+                extend_columns(cols, parse_page(pdf[i], headers))
+        if not cols["DURATION"] and n_pages:
+            # nessuna riga dopo la pagina 1 (es. report di una sola pagina): ripiega su di essa
+            cols = parse_page(pdf[0])
+    # pulizia interamente in pyarrow.compute, su buffer colonnari; una sola conversione a pandas
+    table = pa.table({c: pa.array(cols[c], type=pa.string()) for c in COLUMNS})
+    table = table.set_column(COLUMNS.index("DURATION_%"), "DURATION_%",
+                             pc.replace_substring(table["DURATION_%"], pattern=",", replacement="."))
+    table = table.set_column(COLUMNS.index("CLIENT"), "CLIENT", pc.utf8_trim_whitespace(table["CLIENT"]))
+    df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
     return df
 
 def df_to_excel_bytes(df: pd.DataFrame) -> bytes:
     output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as xw:
-        df.to_excel(xw, sheet_name="breakdown", index=False)
+    # constant_memory scrive le righe in streaming, ma solo in ordine di riga:
+    # to_excel di pandas procede per colonne, quindi le righe si scrivono a mano
+    # strings_to_urls=False: niente controllo URL su ogni cella (e nessun client trasformato in link)
+    wb = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_urls": False})
+    ws = wb.add_worksheet("breakdown")
+    header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    ws.write_row(0, 0, list(df.columns), header_fmt)
+    values = df.astype(object).where(df.notna(), None)
+    for r, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        ws.write_row(r, 0, row)
+    wb.close()
     return output.getvalue()
 
-# ---------- UI ----------
-st.markdown("## 📊 Estrattore Toggl → Excel")
-st.caption("Carica il report PDF *Project & member breakdown* esportato da Toggl. "
-           "La prima pagina viene ignorata automaticamente. Verranno estratti **solo i progetti e i totali**.")
-
-uploaded = st.file_uploader("Carica il tuo PDF", type=["pdf"], label_visibility="collapsed")
-
-if uploaded:
-    with st.spinner("⏳ Elaborazione del PDF in corso..."):
-        df = process_pdf(uploaded.read())
+def df_to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    # colonnare e compresso: per report grandi è molto più piccolo e veloce da scrivere dell'xlsx
+    output = BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), output, compression="zstd")
+    return output.getvalue()
 
-    if df.empty:
-        st.error("⚠️ Nessuna riga trovata. Assicurati che il PDF sia il report giusto.")
+# ---------- UI ----------
+def main():
+    st.set_page_config(
+        page_title="Toggl → Excel",
+        page_icon="📊",
+        layout="centered"
+    )
+    st.markdown("## 📊 Estrattore Toggl → Excel")
+    st.caption("Carica il report PDF *Project & member breakdown* esportato da Toggl. "
+               "La prima pagina viene ignorata automaticamente (salvo report di una sola pagina). Verranno estratti **solo i progetti e i totali**.")
+
+    uploaded = st.file_uploader("Carica il tuo PDF", type=["pdf"], label_visibility="collapsed")
+
+    if uploaded:
+        with st.spinner("⏳ Elaborazione del PDF in corso..."):
+            pdf_bytes = uploaded.read()
+            df = process_pdf(hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest(), pdf_bytes)
+
+        if df.empty:
+            st.error("⚠️ Nessuna riga trovata. Assicurati che il PDF sia il report giusto.")
+        else:
+            st.success(f"✅ Estratti {len(df)} progetti.")
+            st.dataframe(df, use_container_width=True, height=350)
+
+            xlsx_bytes = df_to_excel_bytes(df)
+            st.download_button(
+                "📥 Scarica Excel",
+                data=xlsx_bytes,
+                file_name="breakdown.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True,
+            )
+            st.download_button(
+                "📦 Scarica Parquet",
+                data=df_to_parquet_bytes(df),
+                file_name="breakdown.parquet",
+                mime="application/vnd.apache.parquet",
+                use_container_width=True,
+            )
     else:
-        st.success(f"✅ Estratti {len(df)} progetti.")
-        st.dataframe(df, use_container_width=True, height=350)
-
-        xlsx_bytes = df_to_excel_bytes(df)
-        st.download_button(
-            "📥 Scarica Excel",
-            data=xlsx_bytes,
-            file_name="breakdown.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True,
-        )
-else:
-    st.info("⬆️ Carica un file PDF per iniziare.")
+        st.info("⬆️ Carica un file PDF per iniziare.")
 
+# Streamlit esegue lo script come "__main__"; con lo start method "spawn" i worker lo
+# reimportano come "__mp_main__" e così non rieseguono la UI
+if __name__ == "__main__":
+    main()